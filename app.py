@@ -1,23 +1,83 @@
 import os
+import ast
+import atexit
 import re
 import csv
-from flask import Flask, request, jsonify, send_from_directory, render_template_string
+import json
+import queue
+import shutil
+import sqlite3
+import multiprocessing
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
-# For PDF text extraction
-try:
-    import pdfplumber
-except Exception:
-    pdfplumber = None
+import text_extract
+from text_extract import extract_text_from_file, file_extension
 
 UPLOAD_DIR = 'uploads'
+DB_FILE = 'claims.db'
+# Legacy CSV store, imported into the database the first time it is created
 CSV_FILE = 'claims_central.csv'
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2))
+MAX_TRACKED_JOBS = 1000
+DB_BATCH_SIZE = 100
+VIEW_PAGE_SIZE = 100
+MAX_VIEW_PAGE_SIZE = 1000
+# PDFs with at least this many pages are split across PDF_WORKERS processes
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 8))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 1))
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 50))
+# Text extraction running longer than this (seconds) is abandoned and its
+# worker processes killed
+PARSE_TIMEOUT = int(os.environ.get('PARSE_TIMEOUT', 30))
+UPLOAD_COPY_BUFFER = 1 << 20
+CLAIM_COLUMNS = ['claimant_name','gram_sabha_id','claim_type','parsed_pairs','filename']
+
+# Patterns used by parse_key_values, compiled once at import
+_KV_RE = re.compile(r'^\s*([A-Za-z0-9\s\/\-\(\)\.]{2,80}?)\s*[:\-]\s*(.+)$')
+_KEYWORD_RE = re.compile(r'\b(age|hectares|survey|total area|gps|date)\b', re.I)
+_HEADINGS = (
+    'name of the claimant', 'name of the claimant(s)', 'name of the spouse',
+    'name of father', 'address', 'village', 'gram panchayat', 'tehsil', 'district',
+    'total area claimed', 'survey numbers', 'gps coordinates', 'date of submission',
+    'tribe', 'family members', 'signature'
+)
+
+@lru_cache(maxsize=256)
+def _heading_re(headings):
+    return re.compile('|'.join(re.escape(h) for h in headings))
+
+_HEADING_RE = _heading_re(_HEADINGS)
+
+# Extraction workers start from a forkserver (spawn where unavailable), never
+# from a fork of this multi-threaded process
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    _mp_context = multiprocessing.get_context('forkserver')
+    _mp_context.set_forkserver_preload(['text_extract'])
+else:
+    _mp_context = multiprocessing.get_context('spawn')
+
+# Background processing of uploads: job id -> Future
+_executor = None
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+# One shared SQLite connection, serialised with _db_lock
+_db = None
+_db_lock = threading.Lock()
+_db_queue = queue.Queue()
 
 # Initialize Flask app - serve from current directory
 app = Flask(__name__, static_folder='.', static_url_path='')
 CORS(app, resources={r"/*": {"origins": "*"}})
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
 
 # Configure CORS for all routes
 @app.after_request
@@ -27,101 +87,232 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-# Helper: extract text from PDF or simple text files
-def extract_text_from_file(filepath, filename):
-    ext = filename.lower().split('.')[-1]
-    text = ''
-    try:
-        if ext == 'pdf':
-            if pdfplumber is None:
-                raise RuntimeError('pdfplumber not installed. Install with: pip install pdfplumber')
-            with pdfplumber.open(filepath) as pdf:
-                pages = [p.extract_text() or '' for p in pdf.pages]
-                text = '\n'.join(pages)
-        elif ext in ('txt',):
-            with open(filepath, 'r', encoding='utf8', errors='ignore') as f:
-                text = f.read()
-        elif ext in ('docx',):
-            try:
-                import docx
-                doc = docx.Document(filepath)
-                text = '\n'.join([p.text for p in doc.paragraphs])
-            except Exception as e:
-                raise RuntimeError('docx support needs python-docx. Install with: pip install python-docx') from e
-        else:
-            # Generic binary fallback: try to read as text
-            with open(filepath, 'rb') as f:
-                raw = f.read()
-                try:
-                    text = raw.decode('utf-8', errors='ignore')
-                except Exception:
-                    text = ''
-    except Exception as e:
-        print(f"Error extracting text from {filename}: {str(e)}")
-        text = f"Error extracting text: {str(e)}"
-    
-    return text
-
 # Helper: simple key-value pair extractor from text
 def parse_key_values(text):
     pairs = {}
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
+    lines = [s for l in text.splitlines() if (s := l.strip())]
     
-    # First pass: look for "Key: Value" or "Key - Value"
-    kv_re = re.compile(r'^\s*([A-Za-z0-9\s\/\-\(\)\.]{2,80}?)\s*[:\-]\s*(.+)$')
-    for ln in lines:
-        m = kv_re.match(ln)
-        if m:
-            k = m.group(1).strip()
-            v = m.group(2).strip()
-            pairs[k] = v
-
-    # Second pass: headings style
+    # Single walk: "Key: Value" / "Key - Value" lines, else remember heading lines
+    heading_lines = []
     for i, ln in enumerate(lines):
+        m = _KV_RE.match(ln)
+        if m:
+            pairs[m.group(1).strip()] = m.group(2).strip()
+            continue
+        if not (3 < len(ln) < 120):
+            continue
         lower = ln.lower()
-        if len(ln) < 120 and len(ln) > 3:
-            headings = [
-                'name of the claimant', 'name of the claimant(s)', 'name of the spouse',
-                'name of father', 'address', 'village', 'gram panchayat', 'tehsil', 'district',
-                'total area claimed', 'survey numbers', 'gps coordinates', 'date of submission',
-                'tribe', 'family members', 'signature'
-            ]
-            for h in headings:
-                if h in lower:
+        if _HEADING_RE.search(lower):
+            heading_lines.append((i, lower))
+
+    # Headings style: value is the next short line, only for headings
+    # that no "Key: Value" line already covered
+    if heading_lines:
+        found_lower = [k.lower() for k in pairs]
+        remaining = tuple(h for h in _HEADINGS if not any(h in k for k in found_lower))
+        if remaining:
+            heading_re = _heading_re(remaining)
+            for i, lower in heading_lines:
+                if heading_re.search(lower):
                     for j in range(i+1, min(i+6, len(lines))):
                         cand = lines[j]
                         if len(cand) > 0 and len(cand) < 200:
-                            pairs[ln] = cand
+                            pairs[lines[i]] = cand
                             break
 
     if not pairs:
         misc_lines = []
         for ln in lines[:200]:
-            if re.search(r'\b(age|hectares|survey|total area|gps|date)\b', ln, re.I):
+            if _KEYWORD_RE.search(ln):
                 misc_lines.append(ln)
         if misc_lines:
             pairs['misc'] = '; '.join(misc_lines)
     
     return pairs
 
-# Append to CSV
-def append_to_csv(form_fields, parsed_pairs):
-    file_exists = os.path.exists(CSV_FILE)
+_CLAIM_SELECT = f"SELECT {', '.join(CLAIM_COLUMNS)} FROM claims"
+_CLAIM_INSERT = f"INSERT INTO claims ({', '.join(CLAIM_COLUMNS)}) VALUES ({', '.join('?' * len(CLAIM_COLUMNS))})"
+
+# Open the claims database, creating the schema on first run
+def init_db():
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS claims (
+                id INTEGER PRIMARY KEY,
+                claimant_name TEXT,
+                gram_sabha_id TEXT,
+                claim_type TEXT,
+                parsed_pairs TEXT,
+                filename TEXT,
+                ts TEXT DEFAULT CURRENT_TIMESTAMP
+            )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_claims_gram_sabha_id ON claims(gram_sabha_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_claims_filename ON claims(filename)')
+
+    if conn.execute('SELECT 1 FROM claims LIMIT 1').fetchone() is None and os.path.exists(CSV_FILE):
+        try:
+            import_csv(conn)
+        except Exception as e:
+            print(f"Error importing {CSV_FILE}: {str(e)}")
+    return conn
+
+# Old CSV rows stored parsed_pairs as a Python dict repr; store JSON like new rows
+def legacy_pairs_to_json(value):
+    try:
+        pairs = ast.literal_eval(value)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return value
+    if not isinstance(pairs, dict):
+        return value
+    return json.dumps(pairs, ensure_ascii=False, separators=(',', ':'))
+
+# Copy rows from the legacy CSV into an empty database
+def import_csv(conn):
+    with open(CSV_FILE, 'r', newline='', encoding='utf8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        rows = [dict(zip(header, row)) for row in reader if len(row) == len(header)]
+    for row in rows:
+        row['parsed_pairs'] = legacy_pairs_to_json(row.get('parsed_pairs', ''))
+    with conn:
+        conn.executemany(_CLAIM_INSERT, [[row.get(c, '') for c in CLAIM_COLUMNS] for row in rows])
+    print(f"Imported {len(rows)} rows from {CSV_FILE}")
+
+# Insert a batch of rows in one transaction
+def write_claim_rows(rows):
+    with _db_lock, _db:
+        _db.executemany(_CLAIM_INSERT, rows)
+
+# Single writer thread: drains whatever rows are queued and writes them together
+def db_writer_loop():
+    while True:
+        batch = [_db_queue.get()]
+        while len(batch) < DB_BATCH_SIZE:
+            try:
+                batch.append(_db_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            write_claim_rows([item['row'] for item in batch])
+        except Exception as e:
+            for item in batch:
+                item['error'] = e
+        for item in batch:
+            item['done'].set()
+
+# Store a claim (blocks until the writer thread has committed the row)
+def save_claim(form_fields, parsed_pairs):
+    row = [
+        form_fields.get('claimant_name',''),
+        form_fields.get('gram_sabha_id',''),
+        form_fields.get('claim_type',''),
+        json.dumps(parsed_pairs, ensure_ascii=False, separators=(',', ':')),
+        form_fields.get('filename','')
+    ]
+    item = {'row': row, 'done': threading.Event(), 'error': None}
+    _db_queue.put(item)
+    item['done'].wait()
+    if item['error'] is not None:
+        print(f"Error writing to database: {str(item['error'])}")
+        raise item['error']
+
+def count_claims():
+    with _db_lock:
+        return _db.execute('SELECT COUNT(*) FROM claims').fetchone()[0]
+
+def fetch_claims(limit, offset):
+    with _db_lock:
+        rows = _db.execute(f'{_CLAIM_SELECT} ORDER BY id LIMIT ? OFFSET ?', (limit, offset)).fetchall()
+    return [dict(row) for row in rows]
+
+def fetch_last_claim():
+    with _db_lock:
+        row = _db.execute(f'{_CLAIM_SELECT} ORDER BY id DESC LIMIT 1').fetchone()
+    return dict(row) if row is not None else None
+
+# Open the database and start the writer thread and upload executor. Called
+# from wsgi.py and __main__ rather than at import, because extraction workers
+# re-import this module as __mp_main__ under `python app.py`.
+def init_app():
+    global _db, _executor
+    if _db is not None:
+        return
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    _db = init_db()
+    atexit.register(_db.close)
+    threading.Thread(target=db_writer_loop, name='db-writer', daemon=True).start()
+    _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+
+# Errors raised inside an extraction worker (unreadable file, ...), as opposed
+# to errors from the pool itself
+class ExtractionError(Exception):
+    pass
+
+# Run fn over args_list in pool, waiting until deadline at most
+def run_in_pool(pool, fn, args_list, deadline):
+    result = pool.starmap_async(fn, args_list)
     try:
-        with open(CSV_FILE, 'a', newline='', encoding='utf8') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(['claimant_name','gram_sabha_id','claim_type','parsed_pairs','filename'])
-            writer.writerow([
-                form_fields.get('claimant_name',''),
-                form_fields.get('gram_sabha_id',''),
-                form_fields.get('claim_type',''),
-                str(parsed_pairs),
-                form_fields.get('filename','')
-            ])
+        return result.get(max(deadline - time.monotonic(), 0))
+    except multiprocessing.TimeoutError:
+        raise TimeoutError(f'Processing took longer than {PARSE_TIMEOUT} seconds')
     except Exception as e:
-        print(f"Error writing to CSV: {str(e)}")
-        raise
+        raise ExtractionError(str(e)) from e
+
+# Extract text in worker processes owned by this job, giving up PARSE_TIMEOUT
+# seconds after the job starts. The workers are killed when the job ends, so a
+# stuck file never takes other uploads down with it. Long PDFs (pypdfium2
+# backend) are split into one page range per worker.
+def extract_text_in_pool(filepath, filename, ext):
+    deadline = time.monotonic() + PARSE_TIMEOUT
+    pools = [_mp_context.Pool(processes=1)]
+    try:
+        if ext != 'pdf' or not text_extract.pdfium_enabled():
+            return run_in_pool(pools[0], extract_text_from_file, [(filepath, filename, ext)], deadline)[0]
+
+        npages = run_in_pool(pools[0], text_extract.count_pdf_pages, [(filepath,)], deadline)[0]
+        if npages >= PDF_PARALLEL_MIN_PAGES and PDF_WORKERS > 1:
+            # One contiguous chunk per worker keeps document re-opens to a minimum
+            chunk = -(-npages // PDF_WORKERS)
+            pools.append(_mp_context.Pool(processes=PDF_WORKERS))
+        else:
+            chunk = max(npages, 1)
+        ranges = [(filepath, start, min(start + chunk, npages)) for start in range(0, npages, chunk)]
+        chunks = run_in_pool(pools[-1], text_extract.extract_pdfium_page_range, ranges, deadline)
+        return '\n'.join(part for parts in chunks for part in parts)
+    except ExtractionError as e:
+        print(f"Error extracting text from {filename}: {str(e)}")
+        return f"Error extracting text: {str(e)}"
+    finally:
+        for pool in pools:
+            pool.terminate()
+
+# Background job: extract, parse and store an uploaded file
+def process_upload(saved_path, form_fields, ext):
+    try:
+        text = extract_text_in_pool(os.path.abspath(saved_path), form_fields['filename'], ext)
+    finally:
+        # The uniquely named copy is only needed for extraction
+        os.remove(saved_path)
+    parsed = parse_key_values(text)
+    save_claim(form_fields, parsed)
+    return parsed
+
+def submit_job(fn, *args):
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = _executor.submit(fn, *args)
+        # Forget the oldest finished jobs once too many are tracked
+        for old_id in list(_jobs):
+            if len(_jobs) <= MAX_TRACKED_JOBS:
+                break
+            if _jobs[old_id].done():
+                del _jobs[old_id]
+    return job_id
 
 # Serve the main HTML files
 @app.route('/')
@@ -169,15 +360,18 @@ def upload():
             return jsonify(success=False, error='Invalid filename'), 400
 
         allowed_extensions = {'pdf', 'txt', 'docx'}
-        file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
+        file_ext = file_extension(filename)
         if file_ext not in allowed_extensions:
             return jsonify(success=False, error=f'File type not supported. Allowed: {", ".join(allowed_extensions)}'), 400
 
-        saved_path = os.path.join(UPLOAD_DIR, filename)
-        file.save(saved_path)
-
-        text = extract_text_from_file(saved_path, filename)
-        parsed = parse_key_values(text)
+        # Unique name per upload: jobs read the file later, so a second upload
+        # with the same filename must not overwrite one still waiting in the queue
+        saved_path = os.path.join(UPLOAD_DIR, f'{uuid.uuid4().hex}_{filename}')
+        with open(saved_path, 'wb', buffering=UPLOAD_COPY_BUFFER) as dst:
+            shutil.copyfileobj(file.stream, dst, UPLOAD_COPY_BUFFER)
+        if os.path.getsize(saved_path) == 0:
+            os.remove(saved_path)
+            return jsonify(success=False, error='Uploaded file is empty'), 400
 
         form_fields = {
             'claimant_name': claimant_name,
@@ -185,41 +379,59 @@ def upload():
             'claim_type': claim_type,
             'filename': filename
         }
-        append_to_csv(form_fields, parsed)
+        job_id = submit_job(process_upload, saved_path, form_fields, file_ext)
 
         return jsonify(
             success=True,
-            message='File uploaded and processed successfully',
-            parsed_pairs=parsed,
+            message='File uploaded, processing started',
+            job_id=job_id,
             filename=filename
-        ), 200
+        ), 202
 
+    except RequestEntityTooLarge:
+        return jsonify(success=False, error=f'File too large. Maximum size is {MAX_UPLOAD_MB} MB'), 413
     except Exception as e:
         print(f"Upload error: {str(e)}")
         return jsonify(success=False, error=f'Server error: {str(e)}'), 500
 
+@app.route('/job/<job_id>', methods=['GET', 'OPTIONS'])
+def job_status(job_id):
+    if request.method == 'OPTIONS':
+        return jsonify(success=True), 200
+
+    with _jobs_lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        return jsonify(success=False, error='Unknown job id'), 404
+
+    if not future.done():
+        status = 'running' if future.running() else 'queued'
+        return jsonify(success=True, job_id=job_id, status=status), 200
+
+    error = future.exception()
+    if error is not None:
+        print(f"Job {job_id} error: {str(error)}")
+        message = 'Processing timed out' if isinstance(error, TimeoutError) else 'Server error'
+        return jsonify(success=False, job_id=job_id, status='failed', error=f'{message}: {str(error)}'), 200
+
+    return jsonify(success=True, job_id=job_id, status='finished', parsed_pairs=future.result()), 200
+
 @app.route('/view_database', methods=['GET', 'OPTIONS'])
 def view_database():
     if request.method == 'OPTIONS':
         return jsonify(success=True), 200
         
     try:
-        if not os.path.exists(CSV_FILE):
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', VIEW_PAGE_SIZE, type=int), 1), MAX_VIEW_PAGE_SIZE)
+
+        total = count_claims()
+        if total == 0:
             return jsonify(success=False, error='No data found. Upload some files first.'), 404
-            
-        with open(CSV_FILE, 'r', encoding='utf8') as f:
-            rows = list(csv.reader(f))
-            if len(rows) <= 1:
-                return jsonify(success=False, error='No data rows found'), 404
-                
-            header = rows[0]
-            data = []
-            for row in rows[1:]:
-                if len(row) == len(header):
-                    data.append(dict(zip(header, row)))
-                    
-            return jsonify(success=True, rows=data, count=len(data)), 200
-            
+
+        rows = fetch_claims(per_page, (page - 1) * per_page)
+        return jsonify(success=True, rows=rows, count=len(rows), total=total, page=page, per_page=per_page), 200
+
     except Exception as e:
         print(f"Database view error: {str(e)}")
         return jsonify(success=False, error=f'Error reading database: {str(e)}'), 500
@@ -230,22 +442,12 @@ def last_entry():
         return jsonify(success=True), 200
         
     try:
-        if not os.path.exists(CSV_FILE):
+        row = fetch_last_claim()
+        if row is None:
             return jsonify(success=False, error='No data found'), 404
-            
-        with open(CSV_FILE, 'r', encoding='utf8') as f:
-            rows = list(csv.reader(f))
-            if len(rows) <= 1:
-                return jsonify(success=False, error='No data rows found'), 404
-                
-            header = rows[0]
-            last_row = rows[-1]
-            if len(last_row) != len(header):
-                return jsonify(success=False, error='Data format error'), 500
-                
-            row_data = dict(zip(header, last_row))
-            return jsonify(success=True, row=row_data), 200
-            
+
+        return jsonify(success=True, row=row), 200
+
     except Exception as e:
         print(f"Last entry error: {str(e)}")
         return jsonify(success=False, error=f'Error reading last entry: {str(e)}'), 500
@@ -259,12 +461,13 @@ def internal_error(error):
     return jsonify(success=False, error='Internal server error'), 500
 
 if __name__ == '__main__':
+    init_app()
     port = int(os.environ.get('PORT', 5000))
     debug_mode = os.environ.get('FLASK_ENV') == 'development'
     
     print(f"Starting server on port {port}")
     print(f"Upload directory: {UPLOAD_DIR}")
-    print(f"CSV file: {CSV_FILE}")
+    print(f"Database: {DB_FILE}")
     print(f"Access the app at: http://0.0.0.0:{port}/")
     
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
\ No newline at end of file
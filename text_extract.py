@@ -0,0 +1,158 @@
+# Text extraction for uploaded claim files.
+# Kept free of app state so PDF worker processes can import it cheaply.
+import os
+
+# For PDF text extraction
+try:
+    import pypdfium2 as pdfium
+except Exception:
+    pdfium = None
+
+try:
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LTChar, LTContainer
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdftypes import resolve1
+except Exception:
+    PDFPageAggregator = None
+
+try:
+    import pdfplumber
+except Exception:
+    pdfplumber = None
+
+# 'pdfium' (default, fast text-only), 'pdfminer' (no layout analysis) or 'pdfplumber'
+PDF_BACKEND = os.environ.get('PDF_BACKEND', 'pdfium').lower()
+
+# Helper: text of pages [start, stop) with pypdfium2
+def extract_pdfium_page_range(filepath, start, stop):
+    parts = []
+    pdf = pdfium.PdfDocument(filepath)
+    try:
+        for i in range(start, stop):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            parts.append(textpage.get_text_bounded())
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return parts
+
+# Helper: page count of a PDF with pypdfium2
+def count_pdf_pages(filepath):
+    pdf = pdfium.PdfDocument(filepath)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+# Helper: whether PDFs go through pypdfium2 with the configured backend
+def pdfium_enabled():
+    return pdfium is not None and PDF_BACKEND not in ('pdfminer', 'pdfplumber')
+
+def _iter_chars(item):
+    for child in item:
+        if isinstance(child, LTChar):
+            yield child
+        elif isinstance(child, LTContainer):
+            yield from _iter_chars(child)
+
+# Helper: extract PDF text with pdfminer without layout analysis.
+# With laparams=None pdfminer only collects characters in content-stream order
+# (its text output then has no line breaks), so start a new line whenever the
+# baseline moves by more than half a character height.
+def extract_pdf_text_pdfminer(filepath):
+    rsrcmgr = PDFResourceManager()
+    device = PDFPageAggregator(rsrcmgr, laparams=None)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    pages = []
+    with open(filepath, 'rb') as f:
+        for page in PDFPage.get_pages(f):
+            if not page_has_text_ops(page):
+                pages.append('')
+                continue
+            interpreter.process_page(page)
+            out = []
+            prev = None
+            for ch in _iter_chars(device.get_result()):
+                if prev is not None and abs(ch.y0 - prev.y0) > prev.height / 2:
+                    out.append('\n')
+                out.append(ch.get_text())
+                prev = ch
+            pages.append(''.join(out))
+    return '\n'.join(pages)
+
+# Helper: cheap check on a pdfminer PDFPage's raw content before it is
+# interpreted. A page with no text operators (BT) whose XObjects are all
+# images, i.e. a scanned page, cannot yield any text.
+def page_has_text_ops(page):
+    try:
+        data = b''.join(resolve1(stream).get_data() for stream in page.contents)
+        if b'BT' in data:
+            return True
+        xobjects = resolve1(page.resources.get('XObject')) or {}
+        return any(getattr(resolve1(xobj).get('Subtype'), 'name', None) != 'Image'
+                   for xobj in xobjects.values())
+    except Exception:
+        # Unusual structure: let the full extraction decide
+        return True
+
+# Helper: extract PDF text with pdfplumber (slowest, kept as a fallback)
+def extract_pdf_text_pdfplumber(filepath):
+    parts = []
+    with pdfplumber.open(filepath) as pdf:
+        for page in pdf.pages:
+            if page_has_text_ops(page.page_obj):
+                parts.append(page.extract_text() or '')
+            else:
+                parts.append('')
+            # Drop the parsed chars/layout for this page before moving on
+            page.flush_cache()
+            if hasattr(page.get_textmap, 'cache_clear'):
+                page.get_textmap.cache_clear()
+    return '\n'.join(parts)
+
+# Helper: lowercase extension without the dot ('' if there is none)
+def file_extension(filename):
+    return os.path.splitext(filename)[1].lstrip('.').lower()
+
+# Helper: extract text from PDF or simple text files
+def extract_text_from_file(filepath, filename, ext=None):
+    if ext is None:
+        ext = file_extension(filename)
+    text = ''
+    try:
+        if ext == 'pdf':
+            if pdfium_enabled():
+                text = '\n'.join(extract_pdfium_page_range(filepath, 0, count_pdf_pages(filepath)))
+            elif PDFPageAggregator is not None and PDF_BACKEND != 'pdfplumber':
+                text = extract_pdf_text_pdfminer(filepath)
+            elif pdfplumber is not None:
+                text = extract_pdf_text_pdfplumber(filepath)
+            else:
+                raise RuntimeError('No PDF library installed. Install with: pip install pypdfium2')
+        elif ext in ('txt',):
+            with open(filepath, 'r', encoding='utf8', errors='ignore') as f:
+                text = f.read()
+        elif ext in ('docx',):
+            try:
+                import docx
+                doc = docx.Document(filepath)
+                text = '\n'.join([p.text for p in doc.paragraphs])
+            except Exception as e:
+                raise RuntimeError('docx support needs python-docx. Install with: pip install python-docx') from e
+        else:
+            # Generic binary fallback: try to read as text
+            with open(filepath, 'rb') as f:
+                raw = f.read()
+                try:
+                    text = raw.decode('utf-8', errors='ignore')
+                except Exception:
+                    text = ''
+    except Exception as e:
+        print(f"Error extracting text from {filename}: {str(e)}")
+        text = f"Error extracting text: {str(e)}"
+    
+    return text
@@ -0,0 +1,6 @@
+# WSGI entry point for production servers (gunicorn, waitress, ...)
+from app import app, init_app
+
+init_app()
+
+application = app